@@ -8,6 +8,8 @@ import logging
 import configparser
 from pathlib import Path
 
+RTSP_TEMPLATE = "rtsp://{}:{}@{}:{}/Streaming/channels/101"
+
 def read_config(path:str) -> dict:
     """Function for read ".ini" or ".conf" config file.
 
@@ -143,4 +145,34 @@ class ConnectionsConfig(BaseConfig):
 
         self.NAMES = list(self.data.keys())
 
+    def get_path(self, name:str) -> str:
+        """
+        Returns the path to the camera stream.
+
+        Args:
+            name (str): The camera section name, e.g. 'CAMERA_0'.
+
+        Returns:
+            str: The device path, if it is specified, otherwise RTSP url from connection data.
+        """
+        camera = self.data[name]
+
+        if camera["path"]:
+            return camera["path"]
+
+        return RTSP_TEMPLATE.format(camera["login"], camera["password"], camera["ip"], camera["port"])
+
+    def get_tracking_name(self) -> str:
+        """
+        Returns the name of the tracking camera.
+
+        Returns:
+            str: The first camera section with enabled 'track' flag or None.
+        """
+        for name in self.NAMES:
+            if self.data[name]["track"]:
+                return name
+
+        return None
+
 __all__ = (SystemConfig, ConnectionsConfig)
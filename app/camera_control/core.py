@@ -1,16 +1,21 @@
 """
 This module contains the main AI core for drone detection and tracking.
 """
+import json
 import time
+from pathlib import Path
 from multiprocessing import Process
 
 from ultralytics import YOLO
 import numpy as np
+import torch
 import zmq
 
 from sources.logs import get_logger
-from sources import VideoStream, ncoord_to_angle
+from sources import VideoStream
 from sources.tracked_obj import TrackObject
+from sources.bbox import biggest_box
+from sources.shared_frame import TRACKING_FRAME
 from configs import SystemConfig, ConnectionsConfig
 
 logger = get_logger("Core_serv")
@@ -23,14 +28,17 @@ class AICore(Process):
     handles video streams from multiple cameras, runs object detection using YOLO,
     and communicates tracking information to other processes.
     """
-    def __init__(self, daemon = None):
+    def __init__(self, daemon = None, share_frames:bool=False):
         """
         Initializes the AICore process.
 
         Args:
             daemon (bool, optional): Whether the process is a daemon. Defaults to None.
+            share_frames (bool, optional): Publish the tracking camera frames into the shared memory
+                                           for the visualisation. Defaults to False.
         """
         super().__init__(daemon=daemon)
+        self.share_frames = share_frames
         self.config = SystemConfig()
         self.connections = ConnectionsConfig()
 
@@ -40,17 +48,145 @@ class AICore(Process):
 
         self.cameras = []
         self._track_index = None
+        self._frame_ids = {} # last processed frame of every camera
+        self._frame_timeout = 0.1
 
         self.target = None
         self._short_duration = 5
         self._long_duration = 10
+        self._detect_interval = self.config.TRACKING.get("detect_interval", 1) # detector runs on every N-th tracking frame
 
         self.gst = True
-        self.detector = YOLO(self.config.MODEL["path"], task="detect", verbose=True)
         self.image_size = self.config.MODEL["image_size"]
+        self._half = False # FP16 inference flag for PyTorch weights, the engine precision is fixed at export
+        self._overview_count = sum(not self.connections.data[name]["track"] for name in self.connections.NAMES)
 
+        # the detectors are loaded in the child process by run(), CUDA must not be initialized before fork
+        self.detector = None
+        self.track_detector = None
+        self._overview_batch = 1
+        self._drone_class_id = self.config.MODEL["drone_class_id"]
+
+        # ncoord_to_angle is affine: angle * (0.5 - ncoord) = bias + scale * ncoord
+        hor = self.config.OVERVIEW["horiz_angle"]
+        vert = self.config.OVERVIEW["vertic_angle"]
+        self._x_scale, self._x_bias = -hor, 0.5 * hor
+        self._y_scale, self._y_bias = -vert, 0.5 * vert
+
+        self.context = None
         self.running = False
 
+    def _init_detectors(self):
+        """Exports the model, if it is needed, and loads the detectors."""
+        # the model is exported once and loaded twice: the tracker state lives in the predictor,
+        # the tracking camera has its own one and the overview batches do not reset or pollute it
+        model_path = self._prepare_model(self.config.MODEL["path"])
+        self.detector = YOLO(model_path, task="detect", verbose=True)
+        self.track_detector = YOLO(model_path, task="detect", verbose=True)
+        self._overview_batch = min(self._get_max_batch(model_path), max(1, self._overview_count))
+
+    def _prepare_model(self, path:str) -> str:
+        """
+        Returns the model file for the detector.
+
+        PyTorch weights (.pt) are exported to the TensorRT engine next to them.
+        The engine name contains the export settings (e.g. `model_int8_b3_576x1024.engine`),
+        so the engine is rebuilt if the settings or the weights are changed.
+        The engine is INT8 if the calibration dataset is set in the config, else FP16.
+
+        Args:
+            path (str): Path to the YOLO weights or engine.
+
+        Returns:
+            str: Path to the engine, or to the weights if the export failed.
+        """
+        path = Path(path)
+
+        if path.suffix == ".pt":
+            batch = max(1, self._overview_count) # overview cameras are detected in one batch
+            height, width = (self.image_size, self.image_size) if isinstance(self.image_size, int) else self.image_size
+            calib_data = self.config.MODEL.get("calib_data")
+            precision = "fp16" if calib_data is None else "int8"
+            engine = path.with_name(f"{path.stem}_{precision}_b{batch}_{height}x{width}.engine")
+
+            try:
+                if not engine.exists() or engine.stat().st_mtime < path.stat().st_mtime:
+                    logger.info(f"Export {path} to TensorRT {precision.upper()} engine {engine.name}...")
+                    exported = YOLO(str(path), task="detect").export(
+                        format="engine",
+                        imgsz=self.image_size,
+                        half=calib_data is None,
+                        int8=calib_data is not None,
+                        data=calib_data, # unlabeled images for the INT8 calibration
+                        dynamic=True,
+                        batch=batch,
+                        workspace=4,
+                        device=0,
+                        )
+
+                    # ultralytics saves the engine as <stem>.engine
+                    Path(exported).replace(engine)
+
+            except Exception as error:
+                logger.warning(f"TensorRT export error {error}. PyTorch weights are used.")
+
+                # the failed export has moved the model to the GPU in this (core) process,
+                # so the fallback must run after fork, and the memory of that model is released
+                torch.cuda.empty_cache()
+
+                # FP16 inference with the autotuned cuDNN kernels and TF32 matmuls
+                torch.backends.cudnn.benchmark = True
+                torch.set_float32_matmul_precision("high")
+                self._half = True
+
+                return str(path)
+
+            logger.info(f"TensorRT {precision.upper()} engine {engine.name} is used")
+            path = engine
+
+        return str(path)
+
+    def _get_max_batch(self, path:str) -> int:
+        """
+        Returns the maximum number of frames in one detector call.
+
+        Ultralytics writes the export arguments as JSON before the TensorRT engine.
+        A static engine accepts only the batch it was built with, so it gets one frame per call.
+
+        Args:
+            path (str): Path to the YOLO weights or engine.
+
+        Returns:
+            int: The maximum batch size.
+        """
+        path = Path(path)
+
+        if path.suffix != ".engine":
+            return max(1, self._overview_count)
+
+        try:
+            with open(path, "rb") as file:
+                size = int.from_bytes(file.read(4), byteorder="little", signed=True)
+
+                if not 0 < size < 1 << 20:
+                    raise ValueError(f"wrong metadata size {size}")
+
+                metadata = json.loads(file.read(size))
+
+        except (OSError, ValueError) as error:
+            logger.warning(f"No metadata in {path.name} ({error}), the overview frames are detected one by one")
+            return 1
+
+        batch = int(metadata.get("batch", 1))
+
+        if metadata.get("args", {}).get("dynamic"):
+            return batch
+
+        if batch != 1:
+            logger.warning(f"Static engine {path.name} accepts only the batch of {batch} frames, export it with dynamic=True")
+
+        return 1
+
     def _init_connection(self):
         """Initialization socket for processes connection.
         """
@@ -58,8 +194,6 @@ class AICore(Process):
         try:
             self.context = zmq.Context.instance()
 
-            self.context.socket(zmq.PUB)
-
             self.publisher = self.context.socket(zmq.PUB)
             self.publisher.setsockopt(zmq.SNDHWM, 10)
             self.publisher.setsockopt(zmq.RCVHWM, 10)
@@ -75,26 +209,20 @@ class AICore(Process):
 
     def _init_cameras(self):
         """Initializes the video streams from the cameras specified in the config."""
-        template = "rtsp://{}:{}@{}:{}/Streaming/channels/101"
+        for i, name in enumerate(self.connections.NAMES):
+            path = self.connections.get_path(name)
+            codec = self.connections.data[name].get("codec", "h265")
 
-        for i,  camera in enumerate(self.connections.data.values()):
-            
-            if camera["path"]:
-                path = camera["path"]
-            else:
-                login = camera["login"]
-                password = camera["password"]
-                ip = camera["ip"]
-                port = camera["port"]
-                path = template.format(login, password, ip, port)
-            
-            stream = VideoStream(path, gst=self.gst, out_frame=self.image_size)
-
-            if camera["track"]:
+            # every camera is opened once with its final settings
+            if self.connections.data[name]["track"]:
                 self._track_index = i
-                stream.stop()
-                del stream
-                stream = VideoStream(path, gst=self.gst, in_frame=(2560, 1440), fps=30, out_frame=self.image_size)
+                # the decoded frames are shared with the visualisation, so the camera is decoded once.
+                # the frame is used by one detector call, the ring of 8 buffers keeps it for ~0.25 s at 30 fps
+                share_name = TRACKING_FRAME if self.share_frames else None
+                stream = VideoStream(path, gst=self.gst, in_frame=(2560, 1440), fps=30, out_frame=self.image_size, codec=codec, share_name=share_name, ring_size=8)
+            else:
+                # the overview frames wait for the batch of all cameras, so they are not reused
+                stream = VideoStream(path, gst=self.gst, out_frame=self.image_size, codec=codec)
 
             self.cameras.append(stream)
         
@@ -112,11 +240,15 @@ class AICore(Process):
         try:
             for _ in range(10):
                 dummy_input = np.random.randn(*self.image_size, 3)
-                _ = self.detector.predict(
-                        dummy_input, 
-                        imgsz=self.image_size,
-                        verbose=False
-                        )
+
+                # the full overview batch, so an engine of the wrong batch fails here
+                for detector, batch in ((self.detector, self._overview_batch), (self.track_detector, 1)):
+                    _ = detector.predict(
+                            [dummy_input] * batch, 
+                            imgsz=self.image_size,
+                            half=self._half,
+                            verbose=False
+                            )
             
         except Exception as error:
             logger.warning(f"Undefined detector error {error}")
@@ -125,30 +257,81 @@ class AICore(Process):
             logger.info("Detector is ready!")
             return True
 
+    def read_camera(self, index:int) -> np.ndarray:
+        """
+        Waits for a new frame from the camera.
+
+        The same frame is never returned twice, so the detector is not run
+        on the duplicates when it is faster than the camera.
+
+        Args:
+            index (int): Index of the camera.
+
+        Returns:
+            np.ndarray: The frame or None, if there is no new frame during the timeout.
+        """
+        last_id = self._frame_ids.get(index, 0)
+        self._frame_ids[index], frame = self.cameras[index].read_new(last_id, self._frame_timeout)
+
+        return frame
+
     def get_overview_frames(self) -> list:
         """
-        Reads and returns frames from all overview cameras.
+        Waits for new frames from all overview cameras.
 
         Returns:
-            list: A list of frames from the overview cameras.
+            list: A list of frames from the overview cameras, None for a camera
+                  without a new frame.
         """
         frames = []
-        for i, camera in enumerate(self.cameras):
+        for i in range(len(self.cameras)):
             if i != self._track_index:
-                frame = camera.read()
-                frames.append(frame)
+                frames.append(self.read_camera(i))
 
         return frames
     
     def get_tracking_frame(self) -> np.ndarray:
         """
-        Reads and returns a frame from the tracking camera.
+        Waits for a new frame from the tracking camera.
 
         Returns:
-            np.ndarray: The frame from the tracking camera.
+            np.ndarray: The frame from the tracking camera or None,
+                        if there is no new frame during the timeout.
         """
         if self._track_index is not None:
-            return self.cameras[self._track_index].read()
+            return self.read_camera(self._track_index)
+
+    def detect_overview(self, frames:list) -> list:
+        """
+        Runs the detector on the frames of all overview cameras in one batch.
+
+        The batch is split by the maximum batch of the engine.
+
+        Args:
+            frames (list): Frames of the overview cameras, None for a camera without frame.
+
+        Returns:
+            list: Detection results for every frame, None for the missing frames.
+        """
+        batch = [frame for frame in frames if frame is not None]
+
+        if not batch:
+            return [None] * len(frames)
+
+        results = []
+
+        for start in range(0, len(batch), self._overview_batch):
+            results.extend(self.detector.predict(
+                batch[start:start + self._overview_batch],
+                imgsz=self.image_size,
+                half=self._half,
+                conf=self.config.MODEL["overview_conf"],
+                iou=self.config.MODEL["overview_iou"],
+                ))
+
+        results = iter(results)
+
+        return [None if frame is None else next(results) for frame in frames]
 
     def get_biggest_info(self, detection_results):
         """
@@ -167,24 +350,18 @@ class AICore(Process):
         biggest_info = ()
 
         for camera_index, camera_results in enumerate(detection_results):
-            if camera_results is None:
+            if camera_results is None or len(camera_results) == 0:
                 continue
 
-            for result in camera_results:    
-                if result.boxes.cls != self.config.MODEL["drone_class_id"]:
-                    continue
-
-                x, y, w, h = result.boxes.xywh[0]
-
-                obj_area = w * h
+            # the selection runs on the device, the area and the chosen box are copied to the host at once
+            boxes = camera_results.boxes
+            index, obj_area = biggest_box(boxes.data, self._drone_class_id)
+            obj_area, *bbox = torch.cat((obj_area[None], boxes.xywhn[index])).tolist()
 
-                if obj_area >= max_area:
-                    max_area = obj_area
+            if obj_area > 0 and obj_area >= max_area:
+                max_area = obj_area
 
-                    biggest_info = [camera_index, result.boxes.xywhn[0]]
-
-        if biggest_info:
-            biggest_info[1] = biggest_info[1].cpu().tolist()
+                biggest_info = [camera_index, bbox]
 
         return biggest_info
 
@@ -200,11 +377,8 @@ class AICore(Process):
         """
         x, y = bbox[:2]
 
-        hor = self.config.OVERVIEW["horiz_angle"]
-        vert = self.config.OVERVIEW["vertic_angle"]
-
-        x_angles = ncoord_to_angle(x, hor)
-        y_angles = ncoord_to_angle(y, vert)
+        x_angles = self._x_bias + self._x_scale * x
+        y_angles = self._y_bias + self._y_scale * y
 
         return x_angles, y_angles
 
@@ -214,14 +388,15 @@ class AICore(Process):
         """
 
         if self.target is not None:
-            message = self.target.__dict__
-
-            self.publisher.send_json(message)
+            self.publisher.send(self.target.to_bytes())
 
     def reset(self):
-        """Resets the current target."""
+        """Resets the current target and the tracks of the tracking camera."""
         self.target = None
 
+        for tracker in getattr(self.track_detector.predictor, "trackers", ()):
+            tracker.reset()
+
     def overview(self) -> None:
         """
         The overview state logic.
@@ -236,15 +411,7 @@ class AICore(Process):
             if not frames:
                 continue
 
-            detection_results = []
-            for frame in frames:
-                result = self.detector.predict(
-                    frame, 
-                    imgsz=self.image_size,
-                    conf=self.config.MODEL["overview_conf"],
-                    iou=self.config.MODEL["overview_iou"],
-                    )
-                detection_results.append(result[0])
+            detection_results = self.detect_overview(frames)
 
             info = self.get_biggest_info(detection_results)
 
@@ -283,23 +450,18 @@ class AICore(Process):
         standby_time = time.time()
 
         while not tracked:
-            if time.time() - standby_time > self._standby_timeout:
+            now = time.time()
+
+            if now - standby_time > self._standby_timeout:
                 frames = self.get_overview_frames()
 
                 if not frames:
                     continue
 
-                detection_results = []
-                for frame in frames:
-                    result = self.detector.predict(
-                        frame, 
-                        imgsz=self.image_size,
-                        conf=self.config.MODEL["overview_conf"],
-                        iou=self.config.MODEL["overview_iou"],
-                        )
-                    detection_results.append(result[0])
+                detection_results = self.detect_overview(frames)
                 
                 standby_time = time.time()
+                now = standby_time
 
                 info = self.get_biggest_info(detection_results)
 
@@ -317,7 +479,7 @@ class AICore(Process):
                     absolute = (abs_x, abs_y)
 
                     # initializate target
-                    self.target.update(abs=absolute, box=bbox, tracked=False, error=(None, None))
+                    self.target.update(abs=absolute, box=bbox, tracked=False, error=(None, None), now=standby_time)
                     logger.info(f"Update target from cameras {index}")
                 else:
                     logger.info(f"Waiting for target updates")
@@ -325,15 +487,20 @@ class AICore(Process):
             else:
 
                 frame = self.get_tracking_frame()
+                # the frame may be waited for, the detection time is taken after it is received
+                now = time.time()
                 
                 if frame is None:
                     continue
 
-                detection_results = self.detector.track(
+                detection_results = self.track_detector.track(
                     frame, 
                     imgsz=self.image_size,
+                    half=self._half,
                     conf=self.config.MODEL["tracking_conf"],
                     iou=self.config.MODEL["tracking_iou"],
+                    persist=True, # keep the tracks between calls
+                    verbose=False,
                     )
                 
                 info = self.get_biggest_info(detection_results)
@@ -344,12 +511,12 @@ class AICore(Process):
 
                     _, bbox = info
                     err_x, err_y = self.get_angles(bbox)
-                    self.target.update(error=(float(err_x), float(err_y)), tracked=True, box=bbox)
+                    self.target.update(error=(float(err_x), float(err_y)), tracked=True, box=bbox, now=now)
                     logger.info(f"Update target from tracking camera")
             
             self.send_target()
 
-            if time.time() - self.target.time >= self._long_duration:
+            if now - self.target.time >= self._long_duration:
                 self.state = "overview"
                 self.reset()
                 break
@@ -367,18 +534,32 @@ class AICore(Process):
         if self.target is None:
             self.target = TrackObject(0, (0, 119), (0, 0, 20, 20), time=time.time())
 
-        while time.time() - self.target.time < self._short_duration:
+        skipped = 0 # frames after the last detection
+
+        now = time.time()
+
+        while now - self.target.time < self._short_duration:
             frame = self.get_tracking_frame()
+            now = time.time()
 
             if frame is None:
                 continue
 
-            detection_results = self.detector.track(
+            if skipped + 1 < self._detect_interval:
+                # the detector runs on every N-th frame only
+                skipped += 1
+                continue
+
+            skipped = 0
+
+            detection_results = self.track_detector.track(
                 frame, 
                 imgsz=self.image_size,
+                half=self._half,
                 conf=self.config.MODEL["tracking_conf"],
                 iou=self.config.MODEL["tracking_iou"],
-                # verbose=True
+                persist=True, # keep the tracks between calls
+                verbose=False,
                 )
             
             detector_message = (
@@ -397,7 +578,7 @@ class AICore(Process):
                 err_x, err_y = self.get_angles(bbox)
 
                 # update target
-                self.target.update(error=(float(err_x), float(err_y)), box=bbox, tracked=True)
+                self.target.update(error=(float(err_x), float(err_y)), box=bbox, tracked=True, now=now)
 
                 self.send_target()
         
@@ -412,6 +593,8 @@ class AICore(Process):
         """
         logger.info("System initialization...")
         self._init_connection()
+        # the export may take minutes, the cameras are opened after it
+        self._init_detectors()
         self._init_cameras()
         self._warmap_model()
         self.running = True
@@ -431,7 +614,8 @@ class AICore(Process):
             logger.error("Keyboard exit.")
         
         finally:
-            self.context.destroy()
+            if self.context is not None:
+                self.context.destroy()
             
             for camera in self.cameras:
                 camera.stop()
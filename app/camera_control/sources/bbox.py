@@ -4,10 +4,14 @@ class BBox(object):
     def __init__(self, x:int, y:int, w:int, h:int, integer=True):
         if integer:
             self._xywh = int(x), int(y), int(w), int(h)
-            self._xyxy = x - w // 2,    y - h // 2,    x + w // 2,    y + h // 2
+            self._half = w // 2, h // 2
         else:
             self._xywh = float(x), float(y), float(w), float(h)
-            self._xyxy = x - w / 2,    y - h / 2,    x + w / 2,    y + h / 2
+            self._half = w / 2, h / 2
+
+        # center and half size for the point test
+        self._center = x, y
+        self._xyxy = x - self._half[0], y - self._half[1], x + self._half[0], y + self._half[1]
 
 
     def __getitem__(self, index):
@@ -24,10 +28,8 @@ class BBox(object):
 
         elif isinstance(temp, Iterable) and 2 <= len(temp) <= 4:
             ptx, pty, *other = temp
-            x_condition = self._xyxy[0] <= ptx <= self._xyxy[2]
-            y_condition = self._xyxy[1] <= pty <= self._xyxy[3]
 
-            return x_condition and y_condition
+            return abs(ptx - self._center[0]) <= self._half[0] and abs(pty - self._center[1]) <= self._half[1]
         
         else:
             raise ValueError("Point should by the two coordinates (X and Y).")
@@ -42,3 +44,22 @@ class BBox(object):
     @property
     def xywh(self):
         return self._xywh
+
+def biggest_box(data, class_id:int) -> tuple:
+    """Find the biggest box of the class without the python loop over boxes.
+
+    Args:
+        data (np.ndarray | torch.Tensor): boxes in Ultralytics `Boxes.data` layout 
+                                          (x1, y1, x2, y2, [track id], conf, cls)
+        class_id (int): class of the searched object
+
+    Returns:
+        tuple: (index, area) of the biggest box as the scalars of `data` type, they stay on the device
+               and are not synchronized. Area is 0 if there is no box of the class.
+    """
+    areas = (data[:, 2] - data[:, 0]) * (data[:, 3] - data[:, 1])
+    areas = areas * (data[:, -1] == class_id)
+
+    index = areas.argmax()
+
+    return index, areas[index]
@@ -203,8 +203,19 @@ class CarriageController:
             return (False, self.current_x_angle, self.current_y_angle)
 
 
-    def fire(self, mode):
-        self.uart.fire_control(mode)
+    def fire(self, mode) -> bool:
+        """Send the fire mode.
+
+        Args:
+            mode (str): Fire mode, the key of FIRE_COMMANDS.
+
+        Returns:
+            bool: True if the controller has answered the command.
+        """
+        answer = self.uart.fire_control(mode)
+        self.command_executed = self.uart.exec_status()
+
+        return self.command_executed and bool(answer)
 
     def save_position(self):
         """Write the current values of position in config file.:"""
@@ -41,29 +41,23 @@ def descriptor(image: np.ndarray) -> torch.Tensor:
     # Divide image into 8x8 blocks and compute histogram for each
     block_size = 8
     n_bins = 9
-    descriptor_features = []
-    
-    for i in range(0, 64, block_size):
-        for j in range(0, 64, block_size):
-            block_mag = magnitude[i:i+block_size, j:j+block_size]
-            block_grad_x = grad_x[i:i+block_size, j:j+block_size]
-            block_grad_y = grad_y[i:i+block_size, j:j+block_size]
-            
-            # Compute angles
-            angles = cv2.phase(block_grad_x, block_grad_y, angleInDegrees=True)
-            
-            # Create histogram
-            hist, _ = torch.histogram(
-                torch.from_numpy(angles.flatten()).float(),
-                bins=n_bins,
-                range=(0, 180),
-                weight=torch.from_numpy(block_mag.flatten()).float()
-            )
-            
-            descriptor_features.append(hist)
-    
-    # Concatenate all block histograms
-    feature_vector = torch.cat(descriptor_features)
+    n_blocks = 64 // block_size
+
+    # Compute angles
+    angles = torch.from_numpy(cv2.phase(grad_x, grad_y, angleInDegrees=True)).float()
+    weights = torch.from_numpy(magnitude).float()
+
+    # Block of every pixel in row-major order of blocks
+    rows = torch.arange(64) // block_size
+    blocks = rows[:, None] * n_blocks + rows[None, :]
+
+    # Histogram bin in range (0, 180), the angles above are ignored
+    bins = torch.clamp((angles * n_bins / 180).long(), max=n_bins - 1)
+    valid = angles <= 180
+
+    # All block histograms are accumulated at once
+    index = (blocks * n_bins + bins)[valid]
+    feature_vector = torch.zeros(n_blocks * n_blocks * n_bins).index_add_(0, index, weights[valid])
     
     # Add global features
     # Mean and standard deviation of pixel intensities
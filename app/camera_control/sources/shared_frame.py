@@ -0,0 +1,184 @@
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+from .logs import get_logger
+
+logger = get_logger("SharedFrame", terminal=False)
+
+TRACKING_FRAME = "drone_defence_tracking_frame"
+HEADER_SIZE = 3 # seq, height, width as uint64
+WARNING_INTERVAL = 5 # sec between the warnings about the missing block
+
+class SharedFrameWriter:
+    """Publishes the frames into the shared memory for the other processes.
+
+    The header is a seqlock: the sequence number is odd while the frame is written.
+    """
+    def __init__(self, name:str=TRACKING_FRAME):
+        """
+        Args:
+            name (str, optional): Name of the shared memory block. Defaults to TRACKING_FRAME.
+        """
+        self.name = name
+        self.memory = None
+
+    def _create(self, size:int):
+        """Creates the shared memory block for the frames of `size` bytes."""
+        try:
+            # the block of the previous run is left after crash
+            old = shared_memory.SharedMemory(name=self.name)
+            old.close()
+            old.unlink()
+        except FileNotFoundError:
+            pass
+
+        self.memory = shared_memory.SharedMemory(name=self.name, create=True, size=HEADER_SIZE * 8 + size)
+        self._header = np.ndarray((HEADER_SIZE,), dtype=np.uint64, buffer=self.memory.buf)
+        self._data = np.ndarray((size,), dtype=np.uint8, buffer=self.memory.buf, offset=HEADER_SIZE * 8)
+        self._header[:] = 0
+        # the sequence starts from the current time, so the frames of a restarted writer get new ids
+        self._header[0] = time.time_ns() // 2 * 2
+
+    def write(self, frame:np.ndarray):
+        """Copies the frame into the shared memory.
+
+        Args:
+            frame (np.ndarray): BGR frame.
+        """
+        if self.memory is None:
+            self._create(frame.nbytes)
+
+        if frame.nbytes > self._data.nbytes:
+            logger.warning(f"Frame {frame.shape} is bigger than the shared memory, it is skipped")
+            return
+
+        height, width = frame.shape[:2]
+
+        self._header[0] += 1 # odd, writing
+        self._header[1] = height
+        self._header[2] = width
+        self._data[:frame.nbytes] = frame.reshape(-1)
+        self._header[0] += 1 # even, ready
+
+    def close(self):
+        """Closes and removes the shared memory block."""
+        if self.memory is not None:
+            del self._header, self._data
+            self.memory.close()
+
+            # the reader of the same process tree may have unregistered the block in the resource tracker
+            resource_tracker.register(self.memory._name, "shared_memory")
+            self.memory.unlink()
+            self.memory = None
+
+class SharedFrameReader:
+    """Reads the frames published by `SharedFrameWriter`.
+
+    It has the same `read_new` and `stop` methods as VideoStream, so it can replace it.
+
+    Examples:
+    >>> reader = SharedFrameReader()
+    >>> frame_id, frame = reader.read_new(0, timeout=0.1)
+    >>> reader.stop()
+    """
+    def __init__(self, name:str=TRACKING_FRAME, poll_interval:float=0.002, stale_timeout:float=1.0):
+        """
+        Args:
+            name (str, optional): Name of the shared memory block. Defaults to TRACKING_FRAME.
+            poll_interval (float, optional): Sleep between the checks for a new frame in seconds. Defaults to 0.002.
+            stale_timeout (float, optional): The block is attached again if there is no new frame for this time,
+                                             the writer may be restarted with a new block. Defaults to 1.0.
+        """
+        self.name = name
+        self.poll_interval = poll_interval
+        self.stale_timeout = stale_timeout
+        self.memory = None
+        self.is_running = True
+
+        self._seq = None # the last seen sequence number of the block
+        self._seq_time = 0.0 # time of the last change of the sequence number
+        self._warning_time = None # time of the last warning about the missing block
+
+    def _attach(self) -> bool:
+        """Attaches to the shared memory block, if the writer has created it."""
+        if self.memory is not None:
+            return True
+
+        try:
+            self.memory = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            now = time.monotonic()
+
+            if self._warning_time is None or now - self._warning_time >= WARNING_INTERVAL:
+                logger.warning(f"Shared memory {self.name} is not found, waiting for the writer")
+                self._warning_time = now
+
+            return False
+
+        # the reader does not own the block, the resource tracker must not remove it on exit
+        resource_tracker.unregister(self.memory._name, "shared_memory")
+
+        self._header = np.ndarray((HEADER_SIZE,), dtype=np.uint64, buffer=self.memory.buf)
+        self._data = np.ndarray((self.memory.size - HEADER_SIZE * 8,), dtype=np.uint8, buffer=self.memory.buf, offset=HEADER_SIZE * 8)
+
+        self._seq = None
+        self._seq_time = time.monotonic()
+        self._warning_time = None
+
+        return True
+
+    def _detach(self):
+        """Closes the attached shared memory block."""
+        if self.memory is not None:
+            del self._header, self._data
+            self.memory.close()
+            self.memory = None
+
+    def read_new(self, last_id:int=0, timeout:float=None) -> tuple:
+        """Wait for the frame newer than `last_id`.
+
+        Args:
+            last_id (int, optional): Sequence number of the last processed frame. Defaults to 0.
+            timeout (float, optional): Maximum waiting time in seconds. Defaults to None (no limit).
+
+        Returns:
+            tuple: (frame_id, frame). The frame is None if there is no new frame before timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self.is_running:
+            if self._attach():
+                seq = int(self._header[0])
+                now = time.monotonic()
+
+                if seq != self._seq:
+                    self._seq, self._seq_time = seq, now
+
+                elif now - self._seq_time >= self.stale_timeout:
+                    # the old block is kept alive by this reader after the writer is restarted
+                    self._detach()
+                    continue
+
+                height, width = int(self._header[1]), int(self._header[2])
+
+                # zero size: the block is created, the first frame is not written yet
+                if seq != last_id and seq % 2 == 0 and height * width:
+                    frame = self._data[:height * width * 3].reshape(height, width, 3).copy()
+
+                    # the frame was not rewritten during the copy
+                    if int(self._header[0]) == seq:
+                        return seq, frame
+
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+
+            time.sleep(self.poll_interval)
+
+        return last_id, None
+
+    def stop(self):
+        """Detaches from the shared memory block."""
+        self.is_running = False
+        self._detach()
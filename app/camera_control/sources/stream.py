@@ -1,20 +1,29 @@
-from threading import Thread
+from threading import Thread, Condition
 
 import cv2
 import numpy as np
 
 from .logs import get_logger
+from .shared_frame import SharedFrameWriter
 
 logger = get_logger("Stream", terminal=False)
 
 class VideoStream:
     """VideoStream class. Run thread for RTSP Stream. 
     """
-    def __init__(self, stream_path=0, in_frame=(1080, 1920), out_frame=(576, 1024), fps=60, gst=False):
+    def __init__(self, stream_path=0, in_frame=(1080, 1920), out_frame=(576, 1024), fps=60, gst=False, codec="h265", lazy=False, share_name=None, ring_size=0):
         """VideoStream class. Run thread for RTSP Stream.
 
         Args:
             stream_path (int, optional): Path to video or videostream. Defaults to 0.
+            codec (str, optional): Codec of the RTSP stream for the hardware decoder, "h264" or "h265". Defaults to "h265".
+            lazy (bool, optional): Retrieve the frames only while `read_new` is waiting, the other frames
+                                   are grabbed and skipped. `read()` is not updated in this mode. Defaults to False.
+            share_name (str, optional): Name of the shared memory block, where every frame is published
+                                        for the other processes (see SharedFrameReader). Defaults to None.
+            ring_size (int, optional): Number of the reused frame buffers. The frame is overwritten after
+                                       `ring_size` new frames, so it must be copied to keep it longer.
+                                       Defaults to 0 (new array for every frame).
 
         Raises:
             cv2.error: Could not open camera
@@ -27,11 +36,18 @@ class VideoStream:
         """
         self.stream_path = stream_path
         self.frame = None
+        self.frame_id = 0 # sequence number of the last captured frame
+        self._new_frame = Condition()
+        self.lazy = lazy
+        self._demand = False # somebody waits for the next frame in read_new
+        self._shared = None if share_name is None else SharedFrameWriter(share_name)
+        self._ring = [None] * ring_size # buffers are allocated by the first reads
+        self._ring_index = 0
 
         logger.info(f"Initializate of stream {self.stream_path}")
         
         if gst and str(self.stream_path).startswith("rtsp") :
-            pipeline = self.create_rtsp_pipeline(self.stream_path, out_frame[1], out_frame[0])
+            pipeline = self.create_rtsp_pipeline(self.stream_path, out_frame[1], out_frame[0], codec)
             self.cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
         elif gst and str(self.stream_path).startswith("/dev"):
             width, height = in_frame[1], in_frame[0]
@@ -40,7 +56,8 @@ class VideoStream:
         elif gst:
             raise ValueError("Please, specify path rtsp or /dev/* !")
         else:
-            self.cap = cv2.VideoCapture(self.stream_path, cv2.CAP_FFMPEG)
+            # FFMPEG decodes on the GPU if any hardware acceleration is available
+            self.cap = cv2.VideoCapture(self.stream_path, cv2.CAP_FFMPEG, [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
 
         if self.cap.isOpened():
             self.is_running = True
@@ -55,14 +72,41 @@ class VideoStream:
         """Update frame loop in videostream"""
         while self.is_running:
 
-            ret, frame = self.cap.read()
+            buffer = self._ring[self._ring_index] if self._ring else None
+
+            if self.lazy:
+                # the frame is converted only if somebody waits for it
+                ret = self.cap.grab()
+                frame = self.cap.retrieve(buffer)[1] if ret and self._demand else None
+            else:
+                ret, frame = self.cap.read(buffer)
+
             if not ret:
                 logger.info(f"Error: Failed to read frame from camera {self.stream_path}")
                 self.is_running = False
                 break
+
+            if frame is None:
+                continue
+
+            if self._ring:
+                # the decoder writes into the same array next time
+                self._ring[self._ring_index] = frame
+                self._ring_index = (self._ring_index + 1) % len(self._ring)
+
+            if self._shared is not None:
+                self._shared.write(frame)
             
-            self.frame = frame
-            #time.sleep(0.005) # Small delay to prevent excessive CPU usage
+            with self._new_frame:
+                self.frame = frame
+                self.frame_id += 1
+                self._demand = False # the waiting readers get this frame
+                self._new_frame.notify_all()
+
+        # wake up the readers waiting for a frame which never comes
+        with self._new_frame:
+            self._new_frame.notify_all()
+
         logger.info(f"End of stream {self.stream_path}")
 
     def read(self) -> np.ndarray:
@@ -72,6 +116,28 @@ class VideoStream:
         """  
         return self.frame
 
+    def read_new(self, last_id:int=0, timeout:float=None) -> tuple:
+        """Wait for the frame newer than `last_id` instead of polling `read()`.
+
+        Args:
+            last_id (int, optional): Sequence number of the last processed frame. Defaults to 0.
+            timeout (float, optional): Maximum waiting time in seconds. Defaults to None (no limit).
+
+        Returns:
+            tuple: (frame_id, frame). The frame is None if there is no new frame 
+                   before timeout or the stream was stopped.
+        """
+        with self._new_frame:
+            if self.frame_id == last_id:
+                self._demand = True
+
+            self._new_frame.wait_for(lambda: self.frame_id != last_id or not self.is_running, timeout)
+
+            if self.frame_id == last_id:
+                return last_id, None
+
+            return self.frame_id, self.frame
+
     def stop(self):
         """Release the videostream.
         """
@@ -80,14 +146,20 @@ class VideoStream:
             self.thread.join()
             self.cap.release()
 
+        if self._shared is not None:
+            self._shared.close()
+
     @staticmethod
-    def create_rtsp_pipeline(url, output_width:int=1024, output_height:int=576):
+    def create_rtsp_pipeline(url, output_width:int=1024, output_height:int=576, codec:str="h265"):
         """Optimized RTSP pipeline for Jetson Orin"""
+        if codec not in ("h264", "h265"):
+            raise ValueError(f"Unsupported codec {codec}, use h264 or h265")
+
         return (
             f"rtspsrc location={url} latency=0 ! "
-            "rtph265depay !"
+            f"rtp{codec}depay ! "
             "queue max-size-buffers=1 ! "
-            "h265parse ! "
+            f"{codec}parse ! "
             "nvv4l2decoder enable-max-performance=1 ! "
             "nvvidconv ! "
             f"video/x-raw, width=(int){output_width}, height=(int){output_height}, format=BGRx ! "
@@ -1,5 +1,14 @@
+import math
 import time
-from dataclasses import dataclass
+import struct
+import itertools
+from dataclasses import dataclass, field
+
+# seq, tracked, camera, id, abs (x, y), box (x, y, w, h), error (x, y), time
+# seq is the first 8 bytes, so the receiver can check it without unpacking
+MESSAGE = struct.Struct("<Q?ii2d4d2dd")
+
+_sequence = itertools.count(1)
 
 @dataclass
 class TrackObject:
@@ -9,10 +18,11 @@ class TrackObject:
     id: int = None
     error: tuple = (None, None)
     tracked:bool = False
-    time: float = time.time()
+    time: float = field(default_factory=time.time)
+    seq: int = field(default_factory=lambda: next(_sequence)) # changed with every update
     timeout = 15 # sec
 
-    def update(self, *args, **kwargs):
+    def update(self, *args, now:float=None, **kwargs):
 
         for arg in kwargs:
             if arg in self.__dict__.keys(): 
@@ -20,7 +30,48 @@ class TrackObject:
             else:
                 raise ValueError(f"No {arg} key not in TrackingObject structure")
 
-        self.time = time.time()
+        self.time = time.time() if now is None else now
+        self.seq = next(_sequence)
 
     def to_dict(self):
         return self.__dict__
+
+    def to_bytes(self) -> bytes:
+        """Pack the object into the fixed binary message (see MESSAGE).
+
+        None values are packed as -1 for id and NaN for errors.
+        """
+        err_x, err_y = (math.nan if err is None else err for err in self.error)
+
+        return MESSAGE.pack(
+            self.seq,
+            self.tracked,
+            self.camera,
+            -1 if self.id is None else self.id,
+            *self.abs,
+            *self.box,
+            err_x, err_y,
+            self.time,
+        )
+
+    @classmethod
+    def from_bytes(cls, buffer) -> "TrackObject":
+        """Unpack the object from the binary message created by `to_bytes`."""
+        seq, tracked, camera, id, *values, det_time = MESSAGE.unpack_from(buffer)
+        absolute, box, error = values[:2], values[2:6], values[6:]
+
+        return cls(
+            camera=camera,
+            abs=tuple(absolute),
+            box=tuple(box),
+            id=None if id == -1 else id,
+            error=tuple(None if math.isnan(err) else err for err in error),
+            tracked=tracked,
+            time=det_time,
+            seq=seq,
+        )
+
+    @staticmethod
+    def peek_seq(buffer) -> int:
+        """Read the sequence number of the binary message without unpacking it."""
+        return int.from_bytes(buffer[:8], "little")
@@ -11,6 +11,11 @@ logger = get_logger("Uart", terminal=False)
 JETSON_SERIAL = '/dev/ttyTHS0' # for Jetson UART
 DEFAULT_BAUDRATE = 115200
 
+# constant commands are encoded once
+STATUS_COMMAND = b"STATUS\n"
+ZERO_X_COMMAND = b"ZERO_X\n"
+FIRE_COMMANDS = {"fire": b"FIRE:ON\n", "stop": b"FIRE:OFF\n"}
+
 class Uart:
     """Based Uart connection class"""
     def __init__(self, port:str=JETSON_SERIAL, baudrate:int=DEFAULT_BAUDRATE, is_blocking=True):
@@ -34,17 +39,17 @@ class Uart:
         self.__executed = True
         self.__results = []
         
-    def __sender(self, command:str, end_marker:str=None):
+    def __sender(self, command:bytes, end_marker:str=None):
         """Hiden sender.
         Args:
-            command (str): command for sending to uart
+            command (bytes): encoded command for sending to uart
             end_marker (str): marker of end recieve message. If None, will be received the one message. Default None.
         """
         self.__results = []
         self.__executed = False
 
         try:
-            self.port.write(command.encode())
+            self.port.write(command)
 
             time.sleep(0.002)
 
@@ -75,18 +80,15 @@ class Uart:
         """Getting controller information
         """
 
-        command = "STATUS\n"
         end_marker = "FIRING"
 
-        return self.__sender(command, end_marker)
+        return self.__sender(STATUS_COMMAND, end_marker)
 
     def zero_x_coordinates(self):
         """Zeroing X coordinates on the controller
         """
 
-        command = "ZERO_X\n"
-        
-        return self.__sender(command)
+        return self.__sender(ZERO_X_COMMAND)
         
         
     def send_relative(self, x_angle, y_angle):
@@ -97,7 +99,7 @@ class Uart:
             y_angle (float): Degrees of the pithc axis
         """
 
-        command = f"XR{x_angle} YR{y_angle}\n"
+        command = b"XR%.4f YR%.4f\n" % (x_angle, y_angle)
         end_marker = "TIME"
 
         return self.__sender(command, end_marker)
@@ -110,18 +112,13 @@ class Uart:
             y_angle (float): Degrees of the pithc axis
         """
 
-        command = f"XA{x_angle} YA{y_angle}\n"
+        command = b"XA%.4f YA%.4f\n" % (x_angle, y_angle)
         end_marker = "TIME"
             
         return self.__sender(command, end_marker)
 
     def fire_control(self, mode):
-        if mode == "fire":
-            command = "FIRE:ON\n"
-        elif mode == "stop":    
-            command = "FIRE:OFF\n"
-
-        return self.__sender(command)
+        return self.__sender(FIRE_COMMANDS[mode])
 
 
 def main(x_degrees:float=0, y_degrees:float=0):
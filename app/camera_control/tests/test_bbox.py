@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from app.camera_control.sources.bbox import BBox, biggest_box
+
+def test_biggest_box():
+    # x1, y1, x2, y2, conf, cls
+    data = np.array([
+        [0, 0, 10, 10, 0.9, 1],
+        [0, 0, 50, 50, 0.9, 0],
+        [10, 10, 30, 40, 0.8, 1],
+    ])
+
+    assert biggest_box(data, 1) == (2, 600.0)
+
+def test_biggest_box_no_class():
+    data = np.array([[0, 0, 50, 50, 0.9, 0]])
+
+    index, area = biggest_box(data, 1)
+
+    assert area == 0
+
+def test_point_in_bbox():
+    box = BBox(0.5, 0.5, 0.2, 0.4, integer=False)
+
+    assert (0.5, 0.5) in box
+    assert (0.55, 0.6) in box
+    assert (0.7, 0.5) not in box
+    assert (0.5, 0.8) not in box
+    assert box.xyxy == pytest.approx((0.4, 0.3, 0.6, 0.7))
@@ -1,7 +1,52 @@
-from app.camera_controll.sources.tracked_obj import TrackObject
+import time
+
+from app.camera_control.sources.tracked_obj import TrackObject
 
 def test_initialization():
     cases = (
         
     )
 
+
+def test_bytes_roundtrip():
+    target = TrackObject(2, (140.5, 119.0), (0.5, 0.4, 0.1, 0.05), time=1700000000.25)
+
+    restored = TrackObject.from_bytes(target.to_bytes())
+
+    assert restored == target
+    assert restored.id is None
+    assert restored.error == (None, None)
+
+def test_bytes_tracked():
+    target = TrackObject(0, (1.0, 2.0), (0.5, 0.5, 0.2, 0.2), id=7, error=(0.25, -1.5), tracked=True)
+
+    restored = TrackObject.from_bytes(target.to_bytes())
+
+    assert restored.tracked
+    assert restored.id == 7
+    assert restored.error == (0.25, -1.5)
+
+def test_default_time():
+    first = TrackObject(0, (0, 0), (0, 0, 1, 1))
+    time.sleep(0.01)
+    second = TrackObject(0, (0, 0), (0, 0, 1, 1))
+
+    assert second.time > first.time
+
+def test_update_time():
+    target = TrackObject(0, (0, 0), (0, 0, 1, 1))
+
+    target.update(tracked=True, now=42.0)
+
+    assert target.tracked
+    assert target.time == 42.0
+
+def test_seq():
+    target = TrackObject(0, (0, 0), (0, 0, 1, 1))
+    message = target.to_bytes()
+
+    assert TrackObject.peek_seq(message) == target.seq
+
+    target.update(tracked=True)
+
+    assert TrackObject.peek_seq(target.to_bytes()) != TrackObject.peek_seq(message)
@@ -24,11 +24,10 @@ def send_msg_for_testing():
     while True:
         absolute = np.array([abs_x, abs_y]) + np.random.randn(2)
         time.sleep(0.016)
-        test_target = TrackObject(tuple(absolute), bbox)
+        test_target = TrackObject(0, tuple(absolute), bbox)
         print(test_target)
 
-        message = test_target.__dict__
-        socket.send_json(message)
+        socket.send(test_target.to_bytes())
 
         time.sleep(1)
 
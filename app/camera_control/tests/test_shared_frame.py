@@ -0,0 +1,43 @@
+import numpy as np
+
+from app.camera_control.sources.shared_frame import SharedFrameWriter, SharedFrameReader
+
+def test_shared_frame():
+    name = "drone_defence_test_frame"
+    writer = SharedFrameWriter(name)
+    reader = SharedFrameReader(name)
+
+    frame = np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8)
+    writer.write(frame)
+
+    frame_id, shared = reader.read_new(0, timeout=0.1)
+
+    assert frame_id != 0
+    assert np.array_equal(shared, frame)
+
+    # no new frame
+    assert reader.read_new(frame_id, timeout=0.01) == (frame_id, None)
+
+    reader.stop()
+    writer.close()
+
+def test_writer_restart():
+    name = "drone_defence_test_restart"
+    writer = SharedFrameWriter(name)
+    reader = SharedFrameReader(name, stale_timeout=0.05)
+
+    writer.write(np.zeros((48, 64, 3), dtype=np.uint8))
+    frame_id, _ = reader.read_new(0, timeout=0.1)
+
+    # the new writer creates the new block of the other size
+    writer.close()
+    writer = SharedFrameWriter(name)
+    frame = np.random.randint(0, 255, (96, 128, 3), dtype=np.uint8)
+    writer.write(frame)
+
+    _, shared = reader.read_new(frame_id, timeout=0.5)
+
+    assert np.array_equal(shared, frame)
+
+    reader.stop()
+    writer.close()
@@ -8,16 +8,19 @@ AI core.
 import time
 import datetime
 import argparse
+import queue
+from threading import Thread
 from typing import Tuple
 import logging
 
 import numpy as np
+import cv2
 import zmq
 from matplotlib import pyplot as plt
 
 from sources.logs import get_logger, LOGS_DIRECTORY
 from sources import CarriageController
-from sources.bbox import BBox
+from sources.tracked_obj import TrackObject
 from visualisation import Visualization
 from configs import SystemConfig
 
@@ -56,7 +59,7 @@ class PID:
         
         self._integral = 0.0
         self._prev_error = 0.0
-        self._prev_time = time.time()
+        self._prev_time = time.monotonic() # monotonic clock keeps dt positive on system time changes
         
     def update(self, measured_value: float, measurement_time: float = None) -> float:
         """
@@ -64,7 +67,7 @@ class PID:
 
         Args:
             measured_value (float): The current measured value.
-            measurement_time (float, optional): The timestamp of the measurement.
+            measurement_time (float, optional): The time.monotonic() timestamp of the measurement.
                                                 If None, the current time is used.
                                                 Defaults to None.
 
@@ -75,7 +78,7 @@ class PID:
         if measurement_time is not None:
             current_time = measurement_time
         else:
-            current_time = time.time()
+            current_time = time.monotonic()
 
         dt = current_time - self._prev_time
         if dt <= 0:
@@ -93,7 +96,8 @@ class PID:
         
         output = p_term + i_term + d_term
         
-        output = np.clip(output, self.output_limits[0], self.output_limits[1])
+        low, high = self.output_limits
+        output = min(high, max(low, output))
         
         self._prev_error = error
         self._prev_time = current_time
@@ -104,7 +108,7 @@ class PID:
         """Resets the integral and previous error of the PID controller."""
         self._integral = 0.0
         self._prev_error = 0.0
-        self._prev_time = time.time()
+        self._prev_time = time.monotonic()
     
     def set_setpoint(self, setpoint: float):
         """
@@ -136,8 +140,17 @@ class TrackingSystem:
         self.x_pid = PID(kp=config.PID["x_kp"], ki=config.PID["x_ki"], kd=config.PID["x_kd"])
         self.y_pid = PID(kp=config.PID["y_kp"], ki=config.PID["y_ki"], kd=config.PID["y_kd"])
 
+        self.context = None
         self.running = False
-        self._last_data = None # last data message from ai core 
+        self._last_seq = None # sequence number of the last message from ai core
+        self._recv_timeout = 100 # ms
+        self._max_samples = config.TRACKING.get("max_track_samples", 10_000) # size of the PID plot buffers
+        self._aim_x, self._aim_y = 0.5, 0.5 # normalized aim point (center of the frame)
+
+        # only the latest command is waiting for the carriage, the older is dropped
+        self._commands = queue.Queue(maxsize=1)
+        self._command_thread = None
+
         self.debug = debug
         
         if debug:
@@ -157,6 +170,10 @@ class TrackingSystem:
         self.subscriber.connect(f"tcp://127.0.0.1:8000")
         self.subscriber.subscribe(filter_msg)
 
+        # the receive waits with timeout, so the loop can check the running flag
+        self.poller = zmq.Poller()
+        self.poller.register(self.subscriber, zmq.POLLIN)
+
     def get_object_info(self):
         """
         Receives and parses object information from the AI core.
@@ -167,28 +184,75 @@ class TrackingSystem:
                 - tracked (bool): Whether the object is being tracked.
                 - absolute (tuple): The absolute coordinates of the object.
                 - bbox (list): The bounding box of the object.
+                - id (int): The track id of the object.
                 - error (tuple): The tracking error.
                 - time (float): The timestamp of the detection.
+                The values except new_msg are None for a repeated message
+                or if there is no message during the receive timeout.
+        """
+        # CONFLATE keeps only the latest message, so there is no queue to drain
+        if not self.poller.poll(self._recv_timeout):
+            return False, None, None, None, None, None, None
+
+        message = self.subscriber.recv()
+
+        # the core repeats the unchanged target, such message has the same sequence number and is not parsed
+        seq = TrackObject.peek_seq(message)
+
+        if seq == self._last_seq:
+            return False, None, None, None, None, None, None
+
+        self._last_seq = seq
+
+        data = TrackObject.from_bytes(message)
+
+        return True, data.tracked, data.abs, data.box, data.id, data.error, data.time
+
+    def send_command(self, move:str, position:tuple, fire_mode:str):
         """
-        data = self.subscriber.recv_json()
+        Passes the command to the carriage thread without waiting for the UART.
+
+        The not yet executed command is replaced by the new one.
+
+        Args:
+            move (str): "relative" or "absolute" movement.
+            position (tuple): The coordinates of movement.
+            fire_mode (str): "fire" or "stop".
+        """
+        try:
+            self._commands.get_nowait()
+        except queue.Empty:
+            pass
+
+        self._commands.put_nowait((move, position, fire_mode))
+
+    def _command_worker(self):
+        """Executes the carriage commands from the queue."""
+        last_fire_mode = None
 
-        id = data["id"]
-        absolute = data["abs"]
-        bbox = data["box"]
-        error = data["error"]
-        time = data["time"]
+        while self.running:
+            try:
+                move, position, fire_mode = self._commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
 
-        tracked = data["tracked"]
+            if move == "relative":
+                self.controller.move_relative(*position)
+            else:
+                self.controller.move_to_absolute(*position)
 
-        return tracked, absolute, bbox, id, error, time
+            # the mode is remembered only if the controller has answered, a lost command is sent again
+            if fire_mode != last_fire_mode and self.controller.fire(fire_mode):
+                last_fire_mode = fire_mode
 
     def save_results(self):
         """Saves the PID controller's performance data to a plot."""
-        x = np.arange(0, self._num_tracked)
-        plt.plot(x, self._x_errors, color="brown", label='x error')
-        plt.plot(x, self._x_signals, color="lime", label='x signal')
-        plt.plot(x, self._y_errors, color="red", label='y error')
-        plt.plot(x, self._y_signals, color="green", label='y signal')
+        num = min(self._num_tracked, len(self._x_errors))
+        x = np.arange(0, num)
+        plt.plot(x, self._x_errors[:num], color="brown", label='x error')
+        plt.plot(x, self._x_signals[:num], color="lime", label='x signal')
+        plt.plot(x, self._y_errors[:num], color="red", label='y error')
+        plt.plot(x, self._y_signals[:num], color="green", label='y signal')
         plt.plot(x, np.zeros_like(x), color="blue", label='target')
         plt.grid()
         plt.legend()
@@ -206,26 +270,31 @@ class TrackingSystem:
         self.running = True
         plt.plot()
 
-        self._y_errors = []
-        self._x_errors = []
-        self._y_signals = []
-        self._x_signals = []
+        self._command_thread = Thread(target=self._command_worker, daemon=True)
+        self._command_thread.start()
+
+        # the plot samples are written into preallocated arrays, the samples over the limit are not saved
+        self._y_errors = np.empty(self._max_samples, dtype=np.float32)
+        self._x_errors = np.empty(self._max_samples, dtype=np.float32)
+        self._y_signals = np.empty(self._max_samples, dtype=np.float32)
+        self._x_signals = np.empty(self._max_samples, dtype=np.float32)
         self._num_tracked = 0
 
         try:
             while self.running:
                 # moving, *position = self.controller.get_move_info()
-                tracked, absolute, bbox, id, error, det_time = self.get_object_info()
+                new_msg, tracked, absolute, bbox, id, error, det_time = self.get_object_info()
+
+                if not new_msg:
+                    continue
 
                 if tracked:
+                    now = time.monotonic() # one timestamp for both axes
                     x_error = error[0]
                     y_error = -1 * error[1]
 
-                    self._y_errors.append(y_error)
-                    self._x_errors.append(x_error)
-
-                    x_output = self.x_pid.update(x_error)
-                    y_output = self.y_pid.update(y_error)
+                    x_output = self.x_pid.update(x_error, now)
+                    y_output = self.y_pid.update(y_error, now)
 
                     logger.debug(f"x: {x_error} -> {x_output}")
                     logger.debug(f"y: {y_error} -> {y_output}")
@@ -233,14 +302,17 @@ class TrackingSystem:
                     dt_object = datetime.datetime.fromtimestamp(det_time)
                     logger.debug(f"Tracked time: {dt_object} Current time: {datetime.datetime.now()}")
 
-                    self._y_signals.append(y_output)
-                    self._x_signals.append(x_output)
+                    if self._num_tracked < self._max_samples:
+                        self._y_errors[self._num_tracked] = y_error
+                        self._x_errors[self._num_tracked] = x_error
+                        self._y_signals[self._num_tracked] = y_output
+                        self._x_signals[self._num_tracked] = x_output
                     self._num_tracked += 1
                     
-                    self.controller.move_relative(x_output, y_output)
+                    move, position = "relative", (x_output, y_output)
 
                 else:
-                    self.controller.move_to_absolute(*absolute)
+                    move, position = "absolute", absolute
 
                     self.x_pid.reset()
                     self.y_pid.reset()
@@ -249,23 +321,29 @@ class TrackingSystem:
                     #     break 
                 
                 # logic for shutting
-                bbox = BBox(*bbox, integer=False)
-                center = (0.5, 0.5)
+                x, y, w, h = bbox
 
-                if center in bbox:
+                if abs(x - self._aim_x) <= w / 2 and abs(y - self._aim_y) <= h / 2:
                     logger.info("BRRRRRRRRRRRRRRRRRRRRRRRRRRRR!!!!!")
-                    self.controller.fire("fire")
+                    fire_mode = "fire"
                 else:
-                    self.controller.fire("stop")
+                    fire_mode = "stop"
+
+                self.send_command(move, position, fire_mode)
 
         except KeyboardInterrupt:
-            self.running = False
             logger.exception("Keyboard exit.")
         
         finally:
+            self.running = False
+            self._command_thread.join()
+
             self.save_results()
             self.controller.fire("stop")
-            self.context.destroy()
+
+            # the tracking system owns the context instance shared with the visualisation
+            if self.context is not None:
+                self.context.destroy()
 
 def start_system(core=False, debug=False):
     """
@@ -276,15 +354,20 @@ def start_system(core=False, debug=False):
         debug (bool, optional): Whether to start the visualization. Defaults to False.
     """
 
-    if debug:
-        vis = Visualization()
-        vis.start()
-
     if core:
         from core import AICore
-        ai_core = AICore()
+        # the frames are copied into the shared memory only for the visualisation
+        ai_core = AICore(share_frames=debug)
         ai_core.start()
 
+    if debug:
+        # the small drawing calls are faster in one OpenCV thread than with the thread pool contention.
+        # the setting is process-wide, so it is made after the AI core process is forked
+        cv2.setNumThreads(1)
+
+        vis = Visualization()
+        vis.start()
+
     system = TrackingSystem()
     system.run()
 
@@ -1,3 +1,5 @@
+import os
+import queue
 import argparse
 from pathlib import Path
 import datetime
@@ -9,13 +11,17 @@ import numpy as np
 
 from sources.logs import get_logger, LOGS_DIRECTORY
 from sources import VideoStream
-from configs import ConnectionsConfig
+from sources.tracked_obj import TrackObject
+from sources.shared_frame import SharedFrameReader, TRACKING_FRAME
+from configs import ConnectionsConfig, SystemConfig
 
 logger = get_logger("Visual_serv")
 
 RESULTS = LOGS_DIRECTORY.parent.joinpath("results")
 RESULTS.mkdir(exist_ok=True)
 
+JETSON_RELEASE = Path("/etc/nv_tegra_release") # exists only on Jetson
+
 class Visualization(Thread):
     """
     A class to visualize the video stream with object tracking information.
@@ -24,14 +30,21 @@ class Visualization(Thread):
     receive tracking information, draw bounding boxes and other data on the frames,
     and save the output as a video file.
     """
-    def __init__(self):
+    def __init__(self, cpu:int=None, shared:bool=True):
         """
         Initializes the Visualization thread.
 
         Sets up the ZeroMQ subscriber for receiving tracking data, initializes the video stream,
         and prepares for saving the output video.
+
+        Args:
+            cpu (int, optional): CPU core for the drawing loop. Defaults to None (not pinned).
+            shared (bool, optional): Read the frames of the tracking camera decoded by the AI core
+                                     from the shared memory instead of the own camera stream. Defaults to True.
         """
         super().__init__()
+
+        self.cpu = cpu
         self.context = zmq.Context.instance()
         self.subscriber = self.context.socket(zmq.SUB)
         self.subscriber.setsockopt(zmq.CONFLATE, 1)
@@ -39,97 +52,181 @@ class Visualization(Thread):
         self.subscriber.subscribe("")
 
         connections = ConnectionsConfig()
-        camera = None
-        for name in connections.NAMES:
-            if connections.data[name]["track"]:
-                camera = connections.data[name]
-                break
+        camera = connections.get_tracking_name()
 
         if camera is None:
             raise IndexError("Tracked camera is not found")
-        
-        template = "rtsp://{}:{}@{}:{}/Streaming/channels/101"
-        path = camera["path"] if camera["path"] else template.format(camera["login"], camera["password"], camera["ip"], camera["port"])
-        
-        self.video_stream = VideoStream(path, gst=True)
 
         self.frame = None
-        self.width = 1920
-        self.hieght = 1080
+
+        if shared:
+            # the AI core shares the frames in the detector input size
+            self.hieght, self.width = SystemConfig().MODEL["image_size"]
+        else:
+            self.width = 1920
+            self.hieght = 1080
+
+        self._show_size = (640, 420) # size of the window frame
+
+        self._crosshair_color = (0, 0, 0)
+        self._status_font = cv2.FONT_HERSHEY_PLAIN
+        self._set_draw_size(self.width, self.hieght)
+
+        # the status text is formatted only when it changes
+        self._det_time = None
+        self._det_time_text = ""
+        self._now_text = ""
+        self._now_interval = 10 # frames between the current time updates
+        self._frame_counter = 0
+
+        if shared:
+            self.video_stream = SharedFrameReader(TRACKING_FRAME)
+        else:
+            # the stream is scaled to the size of the drawing and the video writer
+            self.video_stream = VideoStream(
+                connections.get_path(camera),
+                gst=True,
+                out_frame=(self.hieght, self.width),
+                codec=connections.data[camera].get("codec", "h265"),
+                lazy=True, # the frames skipped while drawing and writing are not converted
+                )
 
         self._save_dir = Path("results/")
         self._save_dir.mkdir(exist_ok=True)
 
         name = datetime.datetime.now().strftime("%Y%m%d_%H_%M_%S")
-        self.save_path = RESULTS / f"{name}.avi"
+        self.save_path = RESULTS / name # the suffix depends on the writer
 
         self.running = True
 
+    def _set_draw_size(self, width:int, hieght:int):
+        """
+        Precomputes the drawing geometry for the frame size.
+
+        Args:
+            width (int): Width of the drawn frame.
+            hieght (int): Height of the drawn frame.
+        """
+        scale = width / self.width
+
+        # crosshair in the frame center as the frame slices, same pixels as cv2.line with thickness 2
+        cx, cy = width // 2, hieght // 2
+        arm = int(50 * scale)
+        self._crosshair = (np.s_[cy - arm:cy + arm + 1, cx - 1:cx + 2], np.s_[cy - 1:cy + 2, cx - arm:cx + arm + 1])
+        self._box_scale = np.array([width, hieght, width, hieght]) # normalized xywh to pixels
+
+        self._status_scale = 1.5 * scale
+        self._status_thickness = max(1, round(2 * scale))
+        self._status_rows = [(int(25 * scale), int(row * scale)) for row in (30, 60, 90, 120)]
+
     def drow_info(self, frame, info=None):
         """
         Draws tracking information on the frame.
 
         Args:
             frame (np.ndarray): The video frame to draw on.
-            info (dict, optional): A dictionary containing tracking information.
-                                  Defaults to None.
+            info (TrackObject, optional): The tracking information. Defaults to None.
 
         Returns:
             np.ndarray: The frame with the information drawn on it.
         """
-        
-        cv2.line(
-            frame, 
-            (self.width // 2, self.hieght // 2 - 50), 
-            (self.width // 2, self.hieght // 2 + 50),
-            (0, 0, 0),
-            2,
-            cv2.LINE_4
-            
-        )
-        cv2.line(
-            frame, 
-            (self.width // 2 + 50, self.hieght // 2), 
-            (self.width // 2 - 50, self.hieght // 2 ),
-            (0, 0, 0),
-            2,
-            cv2.LINE_4
-                )
+        for line in self._crosshair:
+            frame[line] = self._crosshair_color
         
         tracked = False
 
-        if info:
-            bbox = info.get("box")
-            tracked = info.get("tracked")
-            error = info.get("error")
-            det_time = info.get("time")
+        if info is not None:
+            bbox = info.box
+            tracked = info.tracked
+            error = info.error
+            det_time = info.time
             
             if tracked:
                 color = (0, 255, 0)
-                x, y, w, h = bbox
-                x = x*self.width
-                w = w*self.width
-                y = y*self.width
-                h = h*self.width
-
-                pt1 = (int((x - w // 2)*self.width), int((y - h // 2)*self.hieght))
-                pt2 = (int((x + w // 2)*self.width), int((y + h // 2)*self.hieght))
+                # the box is scaled and converted to int in one call
+                x, y, w, h = (np.asarray(bbox) * self._box_scale).astype(np.int32).tolist()
+
+                pt1 = (x - w // 2, y - h // 2)
+                pt2 = (x + w // 2, y + h // 2)
                 cv2.rectangle(frame, pt1, pt2, (0, 255, 0), 2)
                 cv2.putText(frame, "target", pt1, cv2.FONT_HERSHEY_COMPLEX, 1, (0, 0, 255), 2)
 
-                cv2.circle(frame, (int(x), int(y)), 4, (0, 255, 0), -1)
-                cv2.putText(frame, str((x, y)), (int(x), int(y)), cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 0, 255), 2)
+                cv2.circle(frame, (x, y), 4, (0, 255, 0), -1)
+                cv2.putText(frame, str((x, y)), (x, y), cv2.FONT_HERSHEY_COMPLEX, 0.5, (0, 0, 255), 2)
 
             else:
                 color = (0, 0, 255)
             
-            cv2.putText(frame, f"Track: {tracked}", (25, 30), cv2.FONT_HERSHEY_COMPLEX, 1, color, 2)
-            cv2.putText(frame, f"Error: {error}", (25, 60), cv2.FONT_HERSHEY_COMPLEX, 1, color, 2)
-            cv2.putText(frame, f"Detection time: {datetime.datetime.fromtimestamp(det_time)}", (25, 90), cv2.FONT_HERSHEY_COMPLEX, 1, color, 2)
-            cv2.putText(frame, f"Current time: {datetime.datetime.now()}", (25, 120), cv2.FONT_HERSHEY_COMPLEX, 1, color, 2)
+            if det_time != self._det_time:
+                self._det_time = det_time
+                self._det_time_text = f"Detection time: {datetime.datetime.fromtimestamp(det_time)}"
+
+            if self._frame_counter % self._now_interval == 0:
+                self._now_text = f"Current time: {datetime.datetime.now()}"
+
+            self._frame_counter += 1
+
+            texts = (f"Track: {tracked}", f"Error: {error}", self._det_time_text, self._now_text)
+
+            for text, org in zip(texts, self._status_rows):
+                cv2.putText(frame, text, org, self._status_font, self._status_scale, color, self._status_thickness)
 
         return frame
 
+    @staticmethod
+    def create_writer_pipeline(path, bitrate:int=4_000_000):
+        """NVENC H.264 writer pipeline for Jetson Orin"""
+        return (
+            "appsrc ! "
+            "video/x-raw, format=BGR ! "
+            "videoconvert ! "
+            "video/x-raw, format=BGRx ! "
+            "nvvidconv ! "
+            "video/x-raw(memory:NVMM), format=NV12 ! "
+            f"nvv4l2h264enc bitrate={bitrate} ! "
+            "h264parse ! "
+            "qtmux ! "
+            f"filesink location={path}"
+        )
+
+    def create_writer(self, fps:float=30.0) -> cv2.VideoWriter:
+        """
+        Creates the video writer.
+
+        The frames are encoded by NVENC on Jetson, otherwise (or if the pipeline
+        is not opened) the software XVID encoder is used.
+
+        Args:
+            fps (float, optional): Frame rate of the video. Defaults to 30.0.
+
+        Returns:
+            cv2.VideoWriter: The opened video writer.
+        """
+        if JETSON_RELEASE.exists():
+            self.save_path = self.save_path.with_suffix(".mp4")
+            pipeline = self.create_writer_pipeline(self.save_path)
+            out = cv2.VideoWriter(pipeline, cv2.CAP_GSTREAMER, 0, fps, (self.width, self.hieght), True)
+
+            if out.isOpened():
+                return out
+
+            logger.warning("NVENC writer is not opened, XVID is used.")
+
+        self.save_path = self.save_path.with_suffix(".avi")
+        fourcc = cv2.VideoWriter_fourcc(*'XVID')
+
+        return cv2.VideoWriter(str(self.save_path), fourcc, fps, (self.width, self.hieght), True)
+
+    def _writer_worker(self, out:cv2.VideoWriter):
+        """Writes the frames from the queue until the None frame."""
+        while True:
+            frame = self._write_queue.get()
+
+            if frame is None:
+                break
+
+            out.write(frame)
+
     def stop(self):
         """Stops the visualization thread."""
         self.running = False
@@ -148,19 +245,38 @@ class Visualization(Thread):
                                     Defaults to False.
         """
         if write:
-            fourcc = cv2.VideoWriter_fourcc(*'XVID')
-            out = cv2.VideoWriter(str(self.save_path), fourcc, 30.0, (self.width, self.hieght), True)
+            out = self.create_writer(30.0)
+
+            # the encoding does not stall the drawing, the frames are dropped if the writer is behind
+            self._write_queue = queue.Queue(maxsize=4)
+            writer_thread = Thread(target=self._writer_worker, args=(out,), daemon=True)
+            writer_thread.start()
+
+        # only the drawing loop is pinned, the writer thread is started before and not inherits the core
+        if self.cpu is not None and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {self.cpu}) # 0 is the calling thread on Linux
+
+        # without writing the frame is drawn already at the window size
+        show_only = show and not write
+
+        if show_only:
+            self._set_draw_size(*self._show_size)
             
+        frame_id = 0
+
         try:
             while self.running:
-                temp_frame = self.video_stream.read()
-
+                frame_id, temp_frame = self.video_stream.read_new(frame_id, timeout=0.1)
 
                 if temp_frame is None:
                     continue
 
+                if show_only:
+                    temp_frame = cv2.resize(temp_frame, self._show_size)
+
                 try:
-                    data = self.subscriber.recv_json(flags=zmq.NOBLOCK)
+                    # the message is unpacked directly from the zmq frame memory
+                    data = TrackObject.from_bytes(self.subscriber.recv(flags=zmq.NOBLOCK))
                 except zmq.Again:
                     data = None
 
@@ -168,11 +284,16 @@ class Visualization(Thread):
                 self.frame = self.drow_info(temp_frame, data)
 
                 if write:
-                    out.write(self.frame)
-                    print("Writed ...", end="\r")
+                    try:
+                        self._write_queue.put_nowait(self.frame)
+                        print("Writed ...", end="\r")
+                    except queue.Full:
+                        logger.debug("Writer is busy, frame is dropped")
 
                 if show:
-                    self.frame = cv2.resize(self.frame, (640, 420))
+                    if not show_only:
+                        self.frame = cv2.resize(self.frame, self._show_size)
+
                     cv2.imshow("Detection and Tracking", self.frame)
 
                     key = cv2.waitKey(1)
@@ -183,11 +304,14 @@ class Visualization(Thread):
             pass
         finally:
             if write:
+                self._write_queue.put(None)
+                writer_thread.join()
                 print(f"Complite! Save video as {self.save_path}")
                 out.release()
 
             self.video_stream.stop()
-            self.context.destroy()
+            # the context instance is shared with the tracking system, so only own socket is closed
+            self.subscriber.close()
             cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -195,8 +319,14 @@ if __name__ == "__main__":
     
     parser.add_argument("--write", action="store_true", help="Writed video into results directory")
     parser.add_argument("--show", action="store_true", help="Open window with frames from camera")
+    parser.add_argument("--cpu", type=int, default=None, help="CPU core for the drawing loop")
+    parser.add_argument("--own-stream", action="store_true", help="Open the tracking camera instead of the frames shared by AI core (it shares them in the debug mode only)")
     
     args = parser.parse_args()
 
-    vis = Visualization()
+    # the small drawing calls are faster in one OpenCV thread than with the thread pool contention,
+    # the setting is process-wide
+    cv2.setNumThreads(1)
+
+    vis = Visualization(cpu=args.cpu, shared=not args.own_stream)
     vis.run(write=args.write, show=args.show)
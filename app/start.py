@@ -1,14 +1,18 @@
 """
 This script starts the tracker service.
 
-It launches the `tracker.py` script in a new process.
+It runs the tracking system from `camera_control/tracker.py` in this process,
+the AI core is started by it as a child process.
 """
+import sys
 from pathlib import Path
-from subprocess import Popen
 
-library = Path(__file__).with_name("camera_controll").absolute()
+library = Path(__file__).with_name("camera_control").absolute()
 
-tracker_service = Popen(["python3", f"{library}/tracker.py", "--core", "--debug"])
+# the modules of camera_control import each other by the bare names
+sys.path.append(str(library))
 
-tracker_service.wait()
+from tracker import start_system
 
+if __name__ == "__main__":
+    start_system(core=True, debug=True)
@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import random
 import shutil
 
@@ -11,12 +12,31 @@ images = IMAGES_PATH.glob("*.jpg")
 CALIB_SET = Path("./images")
 CALIB_SET.mkdir(exist_ok=True)
 
-random_set = random.sample(CALIB_SET, 300)
+# --- choose random images ---
+# reservoir sampling, the directory is scanned once and only N_SAMPLES paths are kept
+N_SAMPLES = 300
+random_set = []
+
+for i, path in enumerate(images):
+    if i < N_SAMPLES:
+        random_set.append(path)
+    else:
+        j = random.randint(0, i)
+        if j < N_SAMPLES:
+            random_set[j] = path
 
 # --- copy files ---
+# the images are only read by the calibrator, so the hard link is used instead of the copy
 for i, path in enumerate(random_set):
     new_name = str(i).zfill(5) + ".jpg" # example: 002.jpg 
-    shutil.copyfile(path, CALIB_SET/new_name)
+    new_path = CALIB_SET / new_name
+    new_path.unlink(missing_ok=True)
+
+    try:
+        os.link(path, new_path)
+    except OSError:
+        # other file system or links are not supported
+        shutil.copyfile(path, new_path)
 
 
 # --- write paths in text file ---
@@ -30,8 +50,5 @@ for i, path in enumerate(random_set):
 n_classes = 6
 text_file = CALIB_SET / "data.yaml"
 with open(text_file, "w") as file:
-    file.write("train: ./")
-    file.write("val: ./")
-    file.write("test: ./")
-    file.write(f"nc: {n_classes}")
+    file.write(f"train: ./\nval: ./\ntest: ./\nnc: {n_classes}\n")
     
\ No newline at end of file
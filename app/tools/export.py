@@ -1,3 +1,4 @@
+import sys
 from pathlib import Path
 from tensorrt import tensorrt
 
@@ -5,7 +6,12 @@ tensorrt
 
 from ultralytics import YOLO
 
-def export_yolo(path, batch=1):
+# модули camera_control импортируются по коротким именам
+sys.path.append(str(Path(__file__).parents[1].joinpath("camera_control")))
+
+from configs import ConnectionsConfig
+
+def export_yolo(path, batch=1, dla=None):
     
     model = YOLO(path)
     model.export(
@@ -13,13 +19,20 @@ def export_yolo(path, batch=1):
         int8=True,
         data="/home/jetson/drone-defence/app/tools/calib/images/data.yaml", # для калибровки в int8 используется неразмеченный датасет в размере 200 изображений
         imgsz=(576, 1024), # указывается такое же, как и для обучения. иначе сильно падает Recall 
-        batch=1, # 4 для обзорных камер
-        dynamic=False,
+        batch=batch, # по числу обзорных камер, кадры которых детектируются одним батчем
+        dynamic=batch > 1, # трекинговая камера использует тот же движок с батчем 1
+        workspace=4, # ГБ рабочей памяти для перебора тактик TensorRT
+        device=0 if dla is None else f"dla:{dla}", # на DLA ядре Jetson (0 или 1) освобождается GPU, неподдерживаемые слои выполняются на GPU
         amp=False,
         )
 
 if __name__ == "__main__":
     model_path = "/home/jetson/drone-defence/models/11s_1024.pt"
     print(model_path)
-    export_yolo(model_path)
+
+    # батч по числу обзорных камер, как и у движка, который собирает AICore
+    connections = ConnectionsConfig()
+    overview_count = sum(not connections.data[name]["track"] for name in connections.NAMES)
+
+    export_yolo(model_path, batch=max(1, overview_count))
 
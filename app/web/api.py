@@ -1,6 +1,7 @@
 
 import os
 import sys
+import asyncio
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
 import cv2
 import uvicorn
@@ -11,10 +12,18 @@ from starlette.responses import StreamingResponse
 app = FastAPI()
 current_dir = os.path.dirname(os.path.abspath(__file__))
 
-from app.camera_controll.tracker import Tracker, FRAME
+# FRAME is rebound by the tracker on every frame, it is read as the module attribute
+import app.camera_controll.tracker as tracking
+from app.camera_controll.tracker import Tracker
 from app.camera_controll.overview import Overview
 from app.camera_controll.configs import ConnactionsConfig
 templates = Jinja2Templates(directory=os.path.join(current_dir, "templates"))
+
+# multipart chunks around every jpeg frame
+HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+TRAILER = b'\r\n'
+FRAME_PERIOD = 1 / 30 # sec, camera frame rate
+JPEG_PARAMS = [int(cv2.IMWRITE_JPEG_QUALITY), 75, int(cv2.IMWRITE_JPEG_OPTIMIZE), 0] # smaller and faster than default quality 95
 config = ConnactionsConfig()
 
 logins = [config.data[camera]["login"] for camera in config.data if camera.startswith("OV")]
@@ -50,18 +59,28 @@ async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
-def gen_frames():
+async def gen_frames():
+    last_frame = None
+
     while True:
-        print(FRAME)
-        if FRAME is not None:
-            _, buffer = cv2.imencode('.jpg', FRAME)
-            frame = buffer.tobytes()
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        frame = tracking.FRAME
+
+        # the same frame is not encoded again, wait for the next one
+        if frame is None or frame is last_frame:
+            await asyncio.sleep(FRAME_PERIOD)
+            continue
+
+        last_frame = frame
+
+        # the encoding runs in the thread, the event loop serves the other clients
+        _, buffer = await asyncio.to_thread(cv2.imencode, '.jpg', frame, JPEG_PARAMS)
+
+        # one chunk per frame, the client never gets a part of the multipart frame
+        yield b"".join((HEADER, buffer, TRAILER))
 
 
 @app.get('/video_feed')
-def video_feed():
+async def video_feed():
     return StreamingResponse(gen_frames(),
                     media_type='multipart/x-mixed-replace; boundary=frame')
 